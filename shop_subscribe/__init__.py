@@ -18,3 +18,5 @@ Release logic:
 12. git push
 """
 __version__ = '0.2.1'
+
+default_app_config = 'shop_subscribe.apps.ShopSubscribeConfig'
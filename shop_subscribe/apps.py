@@ -1,5 +1,13 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_save
 
 
 class ShopSubscribeConfig(AppConfig):
     name = 'shop_subscribe'
+
+    def ready(self):
+        from shop.models.customer import CustomerModel
+        from .signals import add_site_subscription
+        # the materialized customer model, not the lazy wrapper
+        post_save.connect(add_site_subscription, sender=CustomerModel._meta.model,
+                          dispatch_uid='shop_subscribe_add_site_subscription')
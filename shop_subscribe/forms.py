@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 from django.forms import widgets, ValidationError
+from django.contrib.sites.shortcuts import get_current_site
 from django.urls import reverse
 from django.core.signing import BadSignature
 from django.utils.translation import ugettext_lazy as _
@@ -8,6 +9,8 @@ from djng.forms.angular_base import SafeTuple
 from djng.styling.bootstrap3.forms import Bootstrap3ModelForm
 from shop.forms.checkout import CustomerForm
 from shop.models.customer import CustomerModel
+from .models import SiteSubscription
+from .prefilter import HONEYPOT_FIELD
 from .utils import send_confirmation_email, logger, unsign, get_customer_from_emailsignature, get_subscription_fields
 
 
@@ -57,6 +60,8 @@ class SubscribeForm(NgSuccessMessageMixin, NgModelFormMixin, NgFormValidationMix
     required_css_class = 'djng-field-required'
     success_message = _("Thanks for subscribing!")
     label_css_classes = ''
+    # rendered hidden in the template and checked by the prefilter
+    honeypot_field = HONEYPOT_FIELD
 
     class Meta:
         model = CustomerModel
@@ -116,9 +121,16 @@ class SubscribeForm(NgSuccessMessageMixin, NgModelFormMixin, NgFormValidationMix
         """
         Only save if email address doesn't already exist in the db
         A confirmation email address will be sent where customers can change subscriptions
+        Existing customers are sent a confirmation email if not subscribed on the current site
         """
-        if CustomerModel.objects.filter(user__email=self.cleaned_data['email']).exists():
-            logger.info('Subscription from {} dropped, email address exists.'.format(self.cleaned_data['email']))
+        email = self.cleaned_data['email']
+        if SiteSubscription.objects.filter(site=get_current_site(self.request), email=email).exists():
+            logger.info('Subscription from {} dropped, already subscribed on this site.'.format(email))
+            return self.instance
+        customer = CustomerModel.objects.filter(user__email=email).first()
+        if customer is not None:
+            # don't attach the existing email address to this session's customer
+            send_confirmation_email(self.request, customer)
             return self.instance
         # email is not assigned by the form probably because it is a related user object field
         self.instance.email = self.cleaned_data['email']
@@ -169,6 +181,9 @@ def ConfirmForm_factory():
             if instance:
                 raise ValueError("Pass in 'request' instead of 'instance'")
 
+            # for save()
+            self.request = request
+
             try:
                 customer, initial = get_customer_from_emailsignature(request)
             except BadSignature:
@@ -190,4 +205,17 @@ def ConfirmForm_factory():
             except BadSignature:
                 raise ValidationError(self.confirm_error)
 
+        def save(self, **kwargs):
+            """
+            Clearing every subscription removes the customer from the current site's list only.
+            Their subscriptions are kept unchanged for any other sites they are subscribed on.
+            """
+            if not any(self.cleaned_data.get(field) for field in subscription_fields):
+                email = self.cleaned_data['email']
+                SiteSubscription.objects.filter(site=get_current_site(self.request), email=email).delete()
+                if SiteSubscription.objects.filter(email=email).exists():
+                    logger.info('{} unsubscribed from site, subscriptions kept for other sites.'.format(email))
+                    return self.instance
+            return super(ConfirmForm, self).save(**kwargs)
+
     return ConfirmForm
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from django.contrib.sites.models import Site
+from django.core.management.base import BaseCommand
+from ...utils import aggregate_engagement, ENGAGEMENT_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = "Roll buffered email open and click events up into subscriber engagement scores."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=ENGAGEMENT_BATCH_SIZE,
+            help="Number of events to score per transaction.")
+        parser.add_argument('--site', type=int, default=None,
+            help="Only aggregate events for this site id, allowing one worker per site.")
+
+    def handle(self, *args, **options):
+        site = Site.objects.get(pk=options['site']) if options['site'] is not None else None
+        processed = aggregate_engagement(site=site, batch_size=options['batch_size'])
+        self.stdout.write("Aggregated {} engagement events.".format(processed))
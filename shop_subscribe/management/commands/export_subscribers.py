@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+import csv
+from django.contrib.sites.models import Site
+from django.core.management.base import BaseCommand
+from ...utils import get_site_recipients, get_subscription_fields
+
+
+class Command(BaseCommand):
+    help = "Export the confirmed subscribers of a site as CSV."
+
+    def add_arguments(self, parser):
+        parser.add_argument('site', type=int,
+            help="Site id to export.")
+        parser.add_argument('--subscription', choices=get_subscription_fields(), default=None,
+            help="Only export customers with this subscription field set.")
+        parser.add_argument('--dormant-days', type=int, default=None,
+            help="Exclude subscribers who have not engaged for this many days.")
+
+    def handle(self, *args, **options):
+        site = Site.objects.get(pk=options['site'])
+        fields = get_subscription_fields()
+        customers = get_site_recipients(site, subscription=options['subscription'],
+                                        dormant_days=options['dormant_days'])
+        writer = csv.writer(self.stdout, lineterminator='\n')
+        writer.writerow(['email'] + fields)
+        for row in customers.values_list('user__email', *fields).iterator():
+            writer.writerow(row)
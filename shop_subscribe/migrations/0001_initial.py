@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EngagementEvent',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('email', models.EmailField(max_length=254, verbose_name='Email')),
+                ('kind', models.CharField(choices=[('open', 'Open'), ('click', 'Click')], max_length=5, verbose_name='Kind')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Created at')),
+            ],
+            options={
+                'verbose_name': 'Engagement event',
+                'verbose_name_plural': 'Engagement events',
+            },
+        ),
+        migrations.CreateModel(
+            name='EngagementScore',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('email', models.EmailField(max_length=254, unique=True, verbose_name='Email')),
+                ('log_score', models.FloatField(editable=False, null=True, verbose_name='Log score')),
+                ('opens', models.PositiveIntegerField(default=0, verbose_name='Opens')),
+                ('clicks', models.PositiveIntegerField(default=0, verbose_name='Clicks')),
+                ('last_engaged', models.DateTimeField(db_index=True, null=True, verbose_name='Last engaged')),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Updated at')),
+            ],
+            options={
+                'verbose_name': 'Engagement score',
+                'verbose_name_plural': 'Engagement scores',
+            },
+        ),
+    ]
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from datetime import datetime
+import re
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.utils import timezone
+import django.utils.timezone
+from shop.models.customer import CustomerModel
+
+
+BATCH_SIZE = 1000
+
+def pending_date(datestring):
+    "Parses the naive isoformat subscription_date previously stored in customer extra"
+    try:
+        date = datetime(*map(int, re.findall(r'\d+', datestring)))
+    except (TypeError, ValueError):
+        return timezone.now()
+    if settings.USE_TZ:
+        date = timezone.make_aware(date)
+    return date
+
+def get_backfill_site_id(apps, has_data):
+    """
+    Existing data is assigned to settings.SITE_ID, or site 1 if not set.
+    Returns None if there is nothing to assign, e.g. on a fresh install where the
+    default site is only created after migrating.
+    """
+    Site = apps.get_model('sites', 'Site')
+    site_id = getattr(settings, 'SITE_ID', 1)
+    if Site.objects.filter(pk=site_id).exists():
+        return site_id
+    if has_data:
+        raise RuntimeError("Site {} does not exist, create it or set SITE_ID before migrating.".format(site_id))
+    return None
+
+def backfill_site_subscriptions(apps, schema_editor):
+    """
+    Existing subscribers are added to the list of settings.SITE_ID, confirmed unless
+    their extra data still holds a pending subscription, which keeps its IP and date
+    so the rate limit carries over.
+    """
+    SiteSubscription = apps.get_model('shop_subscribe', 'SiteSubscription')
+    Customer = apps.get_model(CustomerModel._meta.app_label, CustomerModel._meta.object_name)
+    customers = Customer.objects.exclude(user__email__isnull=True).exclude(user__email='')
+    site_id = get_backfill_site_id(apps, customers.exists())
+    if site_id is None:
+        return
+
+    now = timezone.now()
+    emails = set()
+    rows = []
+    for email, extra in customers.values_list('user__email', 'extra').iterator():
+        if email in emails:
+            continue
+        emails.add(email)
+        extra = extra if isinstance(extra, dict) else {}
+        if 'subscription_IP' in extra:
+            rows.append(SiteSubscription(site_id=site_id, email=email, ip=extra['subscription_IP'] or None,
+                                         subscribed_at=pending_date(extra.get('subscription_date'))))
+        else:
+            rows.append(SiteSubscription(site_id=site_id, email=email, subscribed_at=now, confirmed_at=now))
+        if len(rows) >= BATCH_SIZE:
+            SiteSubscription.objects.bulk_create(rows)
+            rows = []
+    SiteSubscription.objects.bulk_create(rows)
+
+def backfill_engagement_site(apps, schema_editor):
+    "Existing engagement data is assigned to the same site as the subscriptions"
+    EngagementEvent = apps.get_model('shop_subscribe', 'EngagementEvent')
+    EngagementScore = apps.get_model('shop_subscribe', 'EngagementScore')
+    site_id = get_backfill_site_id(apps, EngagementEvent.objects.exists() or EngagementScore.objects.exists())
+    if site_id is not None:
+        EngagementEvent.objects.update(site_id=site_id)
+        EngagementScore.objects.update(site_id=site_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sites', '0002_alter_domain_unique'),
+        (CustomerModel._meta.app_label, '__first__'),
+        ('shop_subscribe', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SiteSubscription',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('email', models.EmailField(db_index=True, max_length=254, verbose_name='Email')),
+                ('ip', models.GenericIPAddressField(blank=True, null=True, verbose_name='IP address')),
+                ('subscribed_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Subscribed at')),
+                ('confirmed_at', models.DateTimeField(blank=True, null=True, verbose_name='Confirmed at')),
+                ('site', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='sites.Site')),
+            ],
+            options={
+                'verbose_name': 'Site subscription',
+                'verbose_name_plural': 'Site subscriptions',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='sitesubscription',
+            unique_together=set([('site', 'email')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='sitesubscription',
+            index_together=set([('site', 'ip', 'subscribed_at'), ('site', 'confirmed_at')]),
+        ),
+        migrations.RunPython(backfill_site_subscriptions, migrations.RunPython.noop),
+        # added nullable, then existing engagement data is assigned to settings.SITE_ID
+        migrations.AddField(
+            model_name='engagementevent',
+            name='site',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='sites.Site'),
+        ),
+        migrations.AddField(
+            model_name='engagementscore',
+            name='site',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='sites.Site'),
+        ),
+        migrations.RunPython(backfill_engagement_site, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='engagementevent',
+            name='site',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='sites.Site'),
+        ),
+        migrations.AlterField(
+            model_name='engagementscore',
+            name='site',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='sites.Site'),
+        ),
+        migrations.AlterIndexTogether(
+            name='engagementevent',
+            index_together=set([('site', 'id')]),
+        ),
+        migrations.AlterField(
+            model_name='engagementscore',
+            name='email',
+            field=models.EmailField(max_length=254, verbose_name='Email'),
+        ),
+        migrations.AlterField(
+            model_name='engagementscore',
+            name='last_engaged',
+            field=models.DateTimeField(null=True, verbose_name='Last engaged'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='engagementscore',
+            unique_together=set([('site', 'email')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='engagementscore',
+            index_together=set([('site', 'last_engaged')]),
+        ),
+    ]
@@ -1,6 +1,14 @@
 # -*- coding: utf-8 -*-
+from datetime import datetime, timedelta
+import math
+from django.conf import settings
+from django.db import models
 from django.contrib.auth import get_user_model
+from django.contrib.sites.models import Site
 from django.core.exceptions import MultipleObjectsReturned
+from django.utils import timezone
+from django.utils.encoding import python_2_unicode_compatible
+from django.utils.translation import ugettext_lazy as _
 from shop.models.customer import CustomerModel
 
 
@@ -50,3 +58,140 @@ class SubscriptionCustomerManagerMixin(object):
                     user.save()
             customer, created = self.get_or_create(user=user)
         return customer, created
+
+
+class SiteSubscriptionQuerySet(models.QuerySet):
+    def for_site(self, site):
+        return self.filter(site=site)
+
+    def confirmed(self):
+        return self.filter(confirmed_at__isnull=False)
+
+
+@python_2_unicode_compatible
+class SiteSubscription(models.Model):
+    """
+    Membership of an email address in a site's subscription list.
+    Only membership is per site, the subscription_ options stay on the customer and are
+    shared by all sites. Per-site queries use the site-leading indexes instead of scanning
+    all customers.
+    """
+    site = models.ForeignKey(Site, on_delete=models.CASCADE, db_index=False, related_name='+')
+    # indexed for lookups across all sites
+    email = models.EmailField(_("Email"), db_index=True)
+    # used for rate limiting, removed on confirmation
+    ip = models.GenericIPAddressField(_("IP address"), null=True, blank=True)
+    subscribed_at = models.DateTimeField(_("Subscribed at"), default=timezone.now)
+    confirmed_at = models.DateTimeField(_("Confirmed at"), null=True, blank=True)
+
+    objects = SiteSubscriptionQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = _("Site subscription")
+        verbose_name_plural = _("Site subscriptions")
+        unique_together = (('site', 'email'),)
+        index_together = (('site', 'ip', 'subscribed_at'), ('site', 'confirmed_at'))
+
+    def __str__(self):
+        return '{} {}'.format(self.site, self.email)
+
+
+ENGAGEMENT_HALF_LIFE = getattr(settings, 'SHOP_SUBSCRIBE_ENGAGEMENT_HALF_LIFE', 30)  # days
+# scores are stored as log2 of their value at this fixed time, so ordering by log_score
+# ranks subscribers by their decayed score at any time without updating every row
+SCORE_EPOCH = datetime(2017, 1, 1, tzinfo=timezone.utc)
+
+def half_lives_since_epoch(when, half_life=ENGAGEMENT_HALF_LIFE):
+    if timezone.is_naive(when):
+        when = timezone.make_aware(when)
+    return (when - SCORE_EPOCH).total_seconds() / timedelta(days=half_life).total_seconds()
+
+
+class EngagementScoreQuerySet(models.QuerySet):
+    """Segments of subscribers by how recently they engaged with an email"""
+    def for_site(self, site):
+        return self.filter(site=site)
+
+    def engaged(self, days=90):
+        return self.filter(last_engaged__gte=timezone.now() - timedelta(days=days))
+
+    def dormant(self, days=90):
+        return self.filter(last_engaged__lt=timezone.now() - timedelta(days=days))
+
+    def ranked(self):
+        """Highest decayed score first"""
+        return self.filter(log_score__isnull=False).order_by('-log_score')
+
+
+@python_2_unicode_compatible
+class EngagementEvent(models.Model):
+    """
+    Append-only write buffer for email opens and clicks.
+    Rows are only ever inserted by the tracking views and deleted by the aggregator,
+    so tracking hits never touch the customer tables. Events are scored per site.
+    """
+    OPEN = 'open'
+    CLICK = 'click'
+    KIND_CHOICES = (
+        (OPEN, _("Open")),
+        (CLICK, _("Click")),
+    )
+
+    site = models.ForeignKey(Site, on_delete=models.CASCADE, db_index=False, related_name='+')
+    email = models.EmailField(_("Email"))
+    kind = models.CharField(_("Kind"), max_length=5, choices=KIND_CHOICES)
+    created_at = models.DateTimeField(_("Created at"), default=timezone.now)
+
+    class Meta:
+        verbose_name = _("Engagement event")
+        verbose_name_plural = _("Engagement events")
+        # per-site aggregation scans by site in pk order
+        index_together = (('site', 'id'),)
+
+    def __str__(self):
+        return '{} {}'.format(self.email, self.kind)
+
+
+@python_2_unicode_compatible
+class EngagementScore(models.Model):
+    """
+    Per-subscriber engagement rolled up from EngagementEvent by aggregate_engagement().
+    The score decays with a half life so it reflects recent behaviour, use get_score()
+    for its current value.
+    """
+    site = models.ForeignKey(Site, on_delete=models.CASCADE, db_index=False, related_name='+')
+    email = models.EmailField(_("Email"))
+    log_score = models.FloatField(_("Log score"), null=True, editable=False)
+    opens = models.PositiveIntegerField(_("Opens"), default=0)
+    clicks = models.PositiveIntegerField(_("Clicks"), default=0)
+    last_engaged = models.DateTimeField(_("Last engaged"), null=True)
+    updated_at = models.DateTimeField(_("Updated at"), default=timezone.now)
+
+    objects = EngagementScoreQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = _("Engagement score")
+        verbose_name_plural = _("Engagement scores")
+        unique_together = (('site', 'email'),)
+        index_together = (('site', 'last_engaged'),)
+
+    def __str__(self):
+        return '{} {:.2f}'.format(self.email, self.get_score())
+
+    def add(self, points, when, half_life=ENGAGEMENT_HALF_LIFE):
+        """Add points for engagement at time when"""
+        if points <= 0:
+            return
+        value = math.log(points, 2) + half_lives_since_epoch(when, half_life)
+        if self.log_score is None:
+            self.log_score = value
+        else:
+            # log2(2 ** log_score + 2 ** value) without overflowing
+            high, low = max(self.log_score, value), min(self.log_score, value)
+            self.log_score = high + math.log(1 + 2 ** (low - high), 2)
+
+    def get_score(self, now=None, half_life=ENGAGEMENT_HALF_LIFE):
+        """Returns the score decayed up to now"""
+        if self.log_score is None:
+            return 0.0
+        return 2 ** (self.log_score - half_lives_since_epoch(now or timezone.now(), half_life))
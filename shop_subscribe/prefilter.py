@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+Cheap checks on subscription requests that run before any database access,
+so junk signups are rejected without creating customers or running queries.
+"""
+from bisect import bisect_left
+import io, os, re, threading, time
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.utils import six
+from django.utils.translation import ugettext_lazy as _
+from .utils import logger
+
+
+BLOCKED_DOMAINS_FILE = getattr(settings, 'SHOP_SUBSCRIBE_BLOCKED_DOMAINS_FILE', None)
+BLOCKED_DOMAINS_RELOAD = getattr(settings, 'SHOP_SUBSCRIBE_BLOCKED_DOMAINS_RELOAD', 60)  # seconds
+HONEYPOT_FIELD = getattr(settings, 'SHOP_SUBSCRIBE_HONEYPOT_FIELD', 'website')
+
+
+def idna_domain(domain):
+    """
+    Returns the lower case ASCII (punycode) form of a domain so Unicode and punycode
+    spellings compare equal. Raises UnicodeError if it cannot be encoded.
+    """
+    return domain.strip().rstrip('.').encode('idna').decode('ascii').lower()
+
+
+class DomainList(object):
+    """
+    Disposable and blocked email domains loaded from a text file, one domain per line
+    and '#' comments, in Unicode or punycode. Kept as a sorted tuple of punycode domains
+    for compact storage and bisect lookups.
+    The file is reloaded when its modification time changes, checked at most once
+    every reload_interval seconds.
+    """
+    def __init__(self, path=None, reload_interval=BLOCKED_DOMAINS_RELOAD):
+        self.path = path
+        self.reload_interval = reload_interval
+        self._domains = ()
+        self._mtime = None
+        self._checked = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        domains = set()
+        with io.open(self.path, encoding='utf-8') as fd:
+            for line in fd:
+                domain = line.split('#', 1)[0].strip()
+                if not domain:
+                    continue
+                try:
+                    domains.add(idna_domain(domain))
+                except UnicodeError:
+                    logger.warning('Ignoring invalid blocked domain {!r} in {}.'.format(domain, self.path))
+        return tuple(sorted(domains))
+
+    def reload(self, force=False):
+        """Reload the file if it has changed"""
+        if not self.path:
+            return
+        now = time.time()
+        if not force and self._checked is not None and now - self._checked < self.reload_interval:
+            return
+        with self._lock:
+            self._checked = now
+            try:
+                mtime = os.stat(self.path).st_mtime
+                if force or mtime != self._mtime:
+                    self._domains = self._load()
+                    self._mtime = mtime
+                    logger.info('Loaded {} blocked domains from {}.'.format(len(self._domains), self.path))
+            except (IOError, OSError, UnicodeError) as e:
+                # keep the last good list
+                logger.warning('Could not load blocked domains from {}: {}'.format(self.path, e))
+
+    def __len__(self):
+        return len(self._domains)
+
+    def __contains__(self, domain):
+        """True if the punycode domain or any of its parent domains is listed"""
+        self.reload()
+        domains = self._domains
+        labels = domain.split('.')
+        for i in range(len(labels)):
+            candidate = '.'.join(labels[i:])
+            index = bisect_left(domains, candidate)
+            if index < len(domains) and domains[index] == candidate:
+                return True
+        return False
+
+blocked_domains = DomainList(BLOCKED_DOMAINS_FILE)
+
+
+_label_re = re.compile(r'^(?!-)[a-z0-9-]{1,63}(?<!-)$')
+def is_mail_domain(domain):
+    """
+    Syntax only check that the punycode domain could have an MX record, no DNS lookups.
+    Rejects IP literals, single labels and numeric top level domains.
+    """
+    if len(domain) > 253:
+        return False
+    labels = domain.split('.')
+    if len(labels) < 2 or labels[-1].isdigit():
+        return False
+    return all(_label_re.match(label) for label in labels)
+
+
+invalid_error = _("Enter a valid email address.")
+blocked_error = _("Please use a permanent email address.")
+def prefilter_subscription(data):
+    """
+    Checks raw subscription form data without touching the database.
+    Raises ValidationError with code 'honeypot', 'invalid' or 'blocked' on rejection.
+    """
+    if data.get(HONEYPOT_FIELD):
+        raise ValidationError('Honeypot field filled', code='honeypot')
+
+    email = data.get('email')
+    if not isinstance(email, six.string_types) or len(email) > 254:
+        raise ValidationError(invalid_error, code='invalid')
+    local, at, domain = email.strip().rpartition('@')
+    if not at or not local or len(local) > 64:
+        raise ValidationError(invalid_error, code='invalid')
+    try:
+        domain = idna_domain(domain)
+    except UnicodeError:
+        raise ValidationError(invalid_error, code='invalid')
+    if not is_mail_domain(domain):
+        raise ValidationError(invalid_error, code='invalid')
+
+    if domain in blocked_domains:
+        raise ValidationError(blocked_error, code='blocked')
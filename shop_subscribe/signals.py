@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+from django.conf import settings
+from django.utils import timezone
+from .models import SiteSubscription
+from .utils import get_subscription_fields, logger
+
+
+def add_site_subscription(sender, instance, created=False, raw=False, **kwargs):
+    """
+    Customers who opt in outside the subscription forms, e.g. at checkout or in the admin,
+    are added to the list of settings.SITE_ID as confirmed.
+    Only customers who are on no site's list are added, so pending confirmations
+    and per-site opt-outs are left alone.
+    """
+    if raw:
+        return
+    site_id = getattr(settings, 'SITE_ID', None)
+    if site_id is None:
+        return
+    if not any(getattr(instance, field, False) for field in get_subscription_fields()):
+        return
+    email = instance.email
+    if not email or SiteSubscription.objects.filter(email=email).exists():
+        return
+    SiteSubscription.objects.get_or_create(site_id=site_id, email=email,
+                                           defaults={'confirmed_at': timezone.now()})
+    logger.info('Customer {} subscribed outside the subscription forms, added to site {}.'.format(email, site_id))
@@ -1,10 +1,12 @@
 # -*- coding: utf-8 -*-
 from django.conf.urls import url
-from .views import SubscribeView, ConfirmView
+from .views import SubscribeView, ConfirmView, TrackOpenView, TrackClickView
 
 
 app_name = 'shop_subscribe'
 urlpatterns = [
     url(r'^subscribe/$', SubscribeView.as_view(), name='subscribe'),
     url(r'^confirm/$', ConfirmView.as_view(), name='confirm'),
+    url(r'^track/open/$', TrackOpenView.as_view(), name='track-open'),
+    url(r'^track/click/$', TrackClickView.as_view(), name='track-click'),
 ]
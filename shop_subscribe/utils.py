@@ -1,10 +1,17 @@
 # -*- coding: utf-8 -*-
 from collections import OrderedDict
-from datetime import datetime
-import re, logging
+from functools import reduce
+import operator
+from datetime import timedelta
+import logging
+from django.conf import settings
+from django.core import signing
 from django.core.signing import Signer, BadSignature
+from django.db import transaction, IntegrityError
+from django.db.models import Q
 from django.template.loader import select_template
 from django.contrib.sites.shortcuts import get_current_site
+from django.utils.http import urlencode
 from django.utils.translation import get_language_from_request
 from django.utils import timezone
 from django.core.urlresolvers import reverse
@@ -19,6 +26,7 @@ from shop.conf import app_settings
 from shop.models.customer import CustomerModel
 from post_office import mail
 from post_office.models import EmailTemplate
+from .models import SiteSubscription, EngagementEvent, EngagementScore
 
 
 # Get an instance of a logger
@@ -39,6 +47,20 @@ def unsign(context):
     signer.unsign(sep.join( sigcontext.values() ))
     return sigcontext
 
+# separate salt so tracking links cannot be used to confirm or manage subscriptions
+track_salt = 'subscribe-track'
+def sign_track(site_id, email, url=''):
+    """
+    Returns a signed token of the sending site id, an email address and optional click url
+    The fields are signed as a structure so their boundaries cannot be moved
+    """
+    return signing.dumps({'s': site_id, 'e': email, 'u': url}, salt=track_salt, compress=True)
+
+def unsign_track(context):
+    "Returns (site_id, email, url) from the tracking link token, raises BadSignature otherwise"
+    data = signing.loads(context.get('t', ''), salt=track_salt)
+    return data['s'], data['e'], data['u']
+
 
 def get_subscription_fields():
     """Returns the list of customer subscription fields"""
@@ -49,7 +71,8 @@ def get_customer_from_emailsignature(request):
     """
     DRF or WSGI requests
     Validate the email signature in either the GET url for initial email link or POST hidden data for form submissions.
-    If the signature is valid return a 'recognized' customer object if not already.
+    If the signature is valid return a 'recognized' customer object if not already,
+    and confirm their pending subscription on the current site if there is one.
     """
     if isinstance(request, DRFRequest):
         try:
@@ -74,6 +97,10 @@ def get_customer_from_emailsignature(request):
     customer.last_access = timezone.now()
     customer.save()
 
+    # the signature does not cover the site, so only confirm a subscription requested on this site
+    SiteSubscription.objects.for_site(get_current_site(request)).filter(
+        email=context['email'], confirmed_at__isnull=True).update(confirmed_at=customer.last_access, ip=None)
+
     if created:
         logger.warning('Customer recreated from confirmation: %s' % context['email'])
 
@@ -112,9 +139,31 @@ def build_confirm_url(request, email='', sig=''):
     url = url + '?email=' + '&sig='.join( (email, sig) )
     return request.build_absolute_uri(url)
 
-def unisoformat(datestring):
-    "Bit of a hacky way to get the date back from python's isoformat string"
-    return datetime(*map(int, re.findall('\d+', datestring)))
+TRACK_URL_SCHEME = getattr(settings, 'SHOP_SUBSCRIBE_TRACK_URL_SCHEME', 'https')
+
+def build_site_track_open_url(site, email, scheme=TRACK_URL_SCHEME):
+    """
+    Build the absolute url of the tracking pixel for an email address sent by site
+    Does not need a request so can be used by bulk sends, add it to the email context as an <img> src
+    """
+    params = urlencode([('t', sign_track(site.pk, email))])
+    return '{}://{}{}?{}'.format(scheme, site.domain, reverse('shop_subscribe:track-open'), params)
+
+def build_site_track_click_url(site, email, url, scheme=TRACK_URL_SCHEME):
+    """
+    Build the absolute url that records a click on an email sent by site and redirects to url
+    The url is signed so the endpoint cannot be used as an open redirect
+    """
+    params = urlencode([('t', sign_track(site.pk, email, url))])
+    return '{}://{}{}?{}'.format(scheme, site.domain, reverse('shop_subscribe:track-click'), params)
+
+def build_track_open_url(request, email):
+    "Build the tracking pixel url for the current site"
+    return build_site_track_open_url(get_current_site(request), email, request.scheme)
+
+def build_track_click_url(request, email, url):
+    "Build the click tracking url for the current site"
+    return build_site_track_click_url(get_current_site(request), email, url, request.scheme)
 
 
 _et_name = 'Subscription confirmation - customer'
@@ -146,22 +195,19 @@ def get_emailtemplate():
 def send_confirmation_email(request, customer):
     """
     Sends direct to post_office
-    Assumes customer will be saved afterward externally
+    Records the unconfirmed subscription on the current site
     """
-    # check that same IP is not making lots of subscriptions and store IP
+    # check that same IP is not making lots of subscriptions on this site
     ip = get_ip(request)
-    now = datetime.now()
-    for c in CustomerModel.objects.exclude(extra__exact='{}').all():
-        try:
-            if (c.extra['subscription_IP'] == ip and
-                (now - unisoformat(c.extra['subscription_date'])).days < 1):
-                logger.warning('Subscription from {} dropped. Same IP ({}) subscribed recently.'.format(customer.email, ip))
-                return False
-        except KeyError:
-            continue
+    site = get_current_site(request)
+    now = timezone.now()
+    if (SiteSubscription.objects.for_site(site)
+            .filter(ip=ip, subscribed_at__gte=now - timedelta(days=1), confirmed_at__isnull=True).exists()):
+        logger.warning('Subscription from {} dropped. Same IP ({}) subscribed recently.'.format(customer.email, ip))
+        return False
 
     context = {
-        'site_name': get_current_site(request).name,
+        'site_name': site.name,
         'confirm_url': build_confirm_url(request, *sign(customer.email)),
         'email': customer.email,
         # requires django-ipware; only returns public IPs
@@ -177,8 +223,108 @@ def send_confirmation_email(request, customer):
         render_on_delivery=True,
     )
 
-    customer.extra.update({
-        'subscription_IP': ip,
-        'subscription_date': now.isoformat(),
-    })
+    SiteSubscription.objects.update_or_create(site=site, email=customer.email,
+                                              defaults={'ip': ip, 'subscribed_at': now})
     return True
+
+
+ENGAGEMENT_OPEN_WEIGHT = getattr(settings, 'SHOP_SUBSCRIBE_ENGAGEMENT_OPEN_WEIGHT', 1.0)
+ENGAGEMENT_CLICK_WEIGHT = getattr(settings, 'SHOP_SUBSCRIBE_ENGAGEMENT_CLICK_WEIGHT', 3.0)
+ENGAGEMENT_BATCH_SIZE = getattr(settings, 'SHOP_SUBSCRIBE_ENGAGEMENT_BATCH_SIZE', 1000)
+
+def record_engagement(site_id, email, kind):
+    """
+    Append an open or click to the engagement buffer
+    A single insert, customers are only updated later by aggregate_engagement()
+    """
+    EngagementEvent.objects.create(site_id=site_id, email=email, kind=kind)
+
+def aggregate_engagement(site=None, batch_size=ENGAGEMENT_BATCH_SIZE):
+    """
+    Roll buffered engagement events up into per-subscriber scores in batches.
+    Each batch is locked, scored and removed from the buffer in one transaction,
+    so overlapping runs never score the same events twice.
+    Pass a site to only process that site's events, so sites can be aggregated in parallel.
+    Returns the number of events processed.
+    """
+    weights = {
+        EngagementEvent.OPEN: ENGAGEMENT_OPEN_WEIGHT,
+        EngagementEvent.CLICK: ENGAGEMENT_CLICK_WEIGHT,
+    }
+    events = EngagementEvent.objects.order_by('pk')
+    if site is not None:
+        events = events.filter(site=site)
+    processed = 0
+    retries = 0
+    while True:
+        try:
+            with transaction.atomic():
+                count = _aggregate_engagement_batch(events, batch_size, weights)
+        except IntegrityError:
+            # another run created one of our new scores first, retry the batch to update it
+            retries += 1
+            if retries > 3:
+                raise
+            continue
+        if not count:
+            return processed
+        processed += count
+        retries = 0
+
+def _aggregate_engagement_batch(events, batch_size, weights):
+    """Score and delete one batch of events, must be called inside a transaction"""
+    # a run blocked here gets the rows back once the other run commits, already deleted
+    batch = list(events.select_for_update().values_list('pk', 'site_id', 'email', 'kind', 'created_at')[:batch_size])
+    if not batch:
+        return 0
+
+    keys = set((site_id, email) for pk, site_id, email, kind, created_at in batch)
+    scores = EngagementScore.objects.select_for_update().filter(
+        site_id__in=set(key[0] for key in keys), email__in=set(key[1] for key in keys))
+    scores = {(s.site_id, s.email): s for s in scores}
+    existing = set(scores)
+    now = timezone.now()
+    for pk, site_id, email, kind, created_at in batch:
+        score = scores.get((site_id, email))
+        if score is None:
+            score = scores[(site_id, email)] = EngagementScore(site_id=site_id, email=email)
+        # each event decays from when it happened
+        score.add(weights.get(kind, 0.0), created_at)
+        if kind == EngagementEvent.OPEN:
+            score.opens += 1
+        else:
+            score.clicks += 1
+        if score.last_engaged is None or created_at > score.last_engaged:
+            score.last_engaged = created_at
+        score.updated_at = now
+    for key in existing:
+        scores[key].save()
+    EngagementScore.objects.bulk_create([score for key, score in scores.items() if key not in existing])
+
+    # delete by pk: events committed later with lower pks must not be lost
+    EngagementEvent.objects.filter(pk__in=[event[0] for event in batch]).delete()
+    return len(batch)
+
+
+def get_site_recipients(site, subscription=None, dormant_days=None):
+    """
+    Returns a queryset of customers with a confirmed subscription on site.
+    Only those with the subscription_ field set, or any subscription_ field if not given.
+    With dormant_days, subscribers who have not opened or clicked in that time are excluded,
+    including those who never have, unless they confirmed within that time.
+    Filtering is done in the database using the site-leading indexes.
+    """
+    subscriptions = SiteSubscription.objects.for_site(site).confirmed()
+    if dormant_days is not None:
+        engaged = EngagementScore.objects.for_site(site).engaged(dormant_days).values('email')
+        subscriptions = subscriptions.filter(
+            Q(confirmed_at__gte=timezone.now() - timedelta(days=dormant_days)) | Q(email__in=engaged))
+    customers = CustomerModel.objects.filter(user__email__in=subscriptions.values('email'))
+    if subscription:
+        customers = customers.filter(**{subscription: True})
+    else:
+        fields = get_subscription_fields()
+        if not fields:
+            return customers.none()
+        customers = customers.filter(reduce(operator.or_, (Q(**{field: True}) for field in fields)))
+    return customers
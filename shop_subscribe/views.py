@@ -1,9 +1,18 @@
 # -*- coding: utf-8 -*-
+import base64
+from django.core.exceptions import ValidationError
+from django.core.signing import BadSignature
+from django.http import HttpResponse, HttpResponseRedirect, Http404
+from django.utils.cache import add_never_cache_headers
+from django.views.generic import View
 from rest_framework.renderers import TemplateHTMLRenderer
 from rest_framework import generics, status
 from rest_framework.response import Response
 from .forms import SubscribeForm, ConfirmForm_factory
 from .serializers import SubscribeSerializer, ConfirmSerializer_factory
+from .models import EngagementEvent
+from .utils import unsign_track, record_engagement, logger
+from .prefilter import prefilter_subscription
 
 
 class SubscribeView(generics.CreateAPIView):
@@ -12,6 +21,16 @@ class SubscribeView(generics.CreateAPIView):
     serializer_class = SubscribeSerializer
 
     def create(self, request):
+        # reject junk before the form can create a customer or query the db
+        try:
+            prefilter_subscription(request.data)
+        except ValidationError as e:
+            logger.info('Subscription from {} rejected by prefilter: {}.'.format(request.data.get('email'), e.code))
+            if e.code == 'honeypot':
+                # pretend success so bots don't learn about the honeypot
+                return Response(request.data, status=status.HTTP_201_CREATED)
+            return Response({'errors': {'email': e.messages}}, status=status.HTTP_400_BAD_REQUEST)
+
         customer_form = SubscribeForm(data=request.data, request=request)
 
         if customer_form.is_valid():
@@ -60,3 +79,37 @@ class ConfirmView(generics.UpdateAPIView):
             return Response(request.data) 
         else:
             return Response({'errors': customer_form.errors}, status=status.HTTP_400_BAD_REQUEST)
+
+
+# transparent 1x1 gif
+TRACKING_PIXEL = base64.b64decode(b'R0lGODlhAQABAIAAAAAAAP///yH5BAEAAAAALAAAAAABAAEAAAIBRAA7')
+
+class TrackOpenView(View):
+    """
+    Tracking pixel for email opens.
+    Always returns the pixel so broken or forged links don't show as broken images.
+    """
+    def get(self, request):
+        try:
+            site_id, email, url = unsign_track(request.GET)
+        except BadSignature:
+            pass
+        else:
+            record_engagement(site_id, email, EngagementEvent.OPEN)
+        response = HttpResponse(TRACKING_PIXEL, content_type='image/gif')
+        add_never_cache_headers(response)
+        return response
+
+
+class TrackClickView(View):
+    """Records a click on an email link and redirects to the signed url"""
+    def get(self, request):
+        try:
+            site_id, email, url = unsign_track(request.GET)
+        except BadSignature:
+            raise Http404("Invalid tracking link")
+        if not url:
+            raise Http404("Invalid tracking link")
+        # credited to the site that sent the email, whichever host the link was opened on
+        record_engagement(site_id, email, EngagementEvent.CLICK)
+        return HttpResponseRedirect(url)